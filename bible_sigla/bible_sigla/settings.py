@@ -122,6 +122,10 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# OCR worker processes per web server process; each one loads its own Tesseract
+# engine, so multiply by the number of gunicorn workers when sizing this.
+SIGLA_OCR_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
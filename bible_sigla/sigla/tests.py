@@ -1,10 +1,26 @@
 from __future__ import annotations
 
-from django.test import TestCase
+import unicodedata
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
 
 import pythonbible as pb
 
-from .utils import DEFAULT_VERSION, find_references, resolve_references
+from . import utils, views
+from .utils import (
+    DEFAULT_VERSION,
+    SiglaExtractionError,
+    extract_text,
+    extract_text_bytes,
+    find_references,
+    find_references_stream,
+    resolve_references,
+)
 
 
 class ReferenceParsingTests(TestCase):
@@ -18,6 +34,101 @@ class ReferenceParsingTests(TestCase):
         self.assertIn((pb.Book.LUKE, 2, 8, 14), pairs)
         self.assertIn((pb.Book.CORINTHIANS_1, 13, 1, 3), pairs)
 
+    def test_find_references_prefers_longest_book_alias(self) -> None:
+        text = "J 3,16 oraz 1 J 4,8; Dz.Ap. 2,1; xMt 5,1"
+
+        references = find_references(text)
+        pairs = [(ref.book, ref.start_chapter, ref.start_verse) for ref in references]
+
+        self.assertEqual(
+            pairs,
+            [(pb.Book.JOHN, 3, 16), (pb.Book.JOHN_1, 4, 8), (pb.Book.ACTS, 2, 1)],
+        )
+
+    def test_find_references_accepts_any_whitespace_after_book_number(self) -> None:
+        for text in ("1\xa0Kor 13,4", "1\tKor 13,4", "1\u202fKor 13,4", "1\u2009Kor 13,4"):
+            with self.subTest(text=text):
+                references = find_references(text)
+                pairs = [(ref.book, ref.start_chapter, ref.start_verse) for ref in references]
+
+                self.assertEqual(pairs, [(pb.Book.CORINTHIANS_1, 13, 4)])
+
+    def test_find_references_accepts_decomposed_diacritics(self) -> None:
+        references = find_references(unicodedata.normalize("NFD", "Pieśń 2,1 i Łk 2,8"))
+        pairs = [(ref.book, ref.start_chapter, ref.start_verse) for ref in references]
+
+        self.assertEqual(pairs, [(pb.Book.SONG_OF_SONGS, 2, 1), (pb.Book.LUKE, 2, 8)])
+
+    def test_find_references_accepts_missing_space_before_chapter(self) -> None:
+        references = find_references("Mt 5,1 1Kor13,4-7 i Łk10,25")
+        pairs = [(ref.book, ref.start_chapter, ref.start_verse) for ref in references]
+
+        self.assertEqual(
+            pairs,
+            [(pb.Book.MATTHEW, 5, 1), (pb.Book.CORINTHIANS_1, 13, 4), (pb.Book.LUKE, 10, 25)],
+        )
+
+    def test_find_references_falls_back_to_shorter_alias_after_verse(self) -> None:
+        cases = {
+            "Mt 5,1-3 J 3,16; Rz 1,1": [(pb.Book.MATTHEW, 5, 1), (pb.Book.JOHN, 3, 16), (pb.Book.ROMANS, 1, 1)],
+            "Łk 2,1 J 3,16 oraz Mt 5,1": [(pb.Book.LUKE, 2, 1), (pb.Book.JOHN, 3, 16), (pb.Book.MATTHEW, 5, 1)],
+            "Ps 2 J 1,1; Mt 5,1": [(pb.Book.PSALMS, 2, 1), (pb.Book.JOHN, 1, 1), (pb.Book.MATTHEW, 5, 1)],
+        }
+
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                references = find_references(text)
+                pairs = [(ref.book, ref.start_chapter, ref.start_verse) for ref in references]
+
+                self.assertEqual(pairs, expected)
+
+    def test_find_references_builds_whole_chapters_and_skips_invalid_ones(self) -> None:
+        references = find_references("Mt 28; Mt 29; Mt 5,3-1")
+
+        self.assertEqual(references, [pb.NormalizedReference(pb.Book.MATTHEW, 28, 1, 28, 20)])
+
+    def test_find_references_stream_joins_lines_and_stops_at_limit(self) -> None:
+        lines = ["Czytania: Mt 5,1-\n", "3 oraz 1\n", "Kor 13,4\n", "J 3,16\n"]
+
+        references = find_references_stream(lines, max_refs=2)
+        pairs = [(ref.book, ref.start_chapter, ref.start_verse, ref.end_verse) for ref in references]
+
+        self.assertEqual(pairs, [(pb.Book.MATTHEW, 5, 1, 3), (pb.Book.CORINTHIANS_1, 13, 4, 4)])
+
+    def test_find_references_stream_rejects_limit_below_one(self) -> None:
+        for max_refs in (0, -1):
+            with self.subTest(max_refs=max_refs), self.assertRaises(ValueError):
+                find_references_stream(["Mt 5,1 Mt 6,1\n"], max_refs=max_refs)
+
+    def test_find_references_folds_en_and_em_dashes_in_verse_ranges(self) -> None:
+        with mock.patch.object(pb, "get_references", side_effect=AssertionError("parser fallback used")):
+            references = find_references("Mt 5,1–3 i Łk 2,8—14")
+
+        pairs = [(ref.book, ref.start_verse, ref.end_verse) for ref in references]
+        self.assertEqual(pairs, [(pb.Book.MATTHEW, 1, 3), (pb.Book.LUKE, 8, 14)])
+
+    def test_find_references_ignores_whitespace_inside_verse_lists(self) -> None:
+        with mock.patch.object(pb, "get_references", side_effect=AssertionError("parser fallback used")):
+            references = find_references("Mt 5,1-\t3, 7 i Łk 2,8-\xa014")
+
+        pairs = [(ref.book, ref.start_verse, ref.end_verse) for ref in references]
+        self.assertEqual(pairs, [(pb.Book.MATTHEW, 1, 3), (pb.Book.MATTHEW, 7, 7), (pb.Book.LUKE, 8, 14)])
+
+    def test_find_references_keeps_long_sigla_whole(self) -> None:
+        verses = ",".join(str(verse) for verse in range(5, 47, 2))
+
+        references = find_references(f"Mt 5,1-3,{verses}")
+
+        self.assertEqual(len(references), 22)
+        self.assertEqual(find_references("Mt 5,1" + " " * 80), [pb.NormalizedReference(pb.Book.MATTHEW, 5, 1, 5, 1)])
+
+    def test_find_references_stream_keeps_siglum_across_blank_lines(self) -> None:
+        lines = ["Czytanie Mt 5,1\n"] + ["\n"] * 70 + ["koniec\n"]
+
+        references = find_references_stream(lines)
+
+        self.assertEqual(references, [pb.NormalizedReference(pb.Book.MATTHEW, 5, 1, 5, 1)])
+
     def test_resolve_references_fetches_passages(self) -> None:
         reference = pb.get_references("Matthew 5:1-3")[0]
 
@@ -25,3 +136,133 @@ class ReferenceParsingTests(TestCase):
 
         self.assertEqual(results[0].label, pb.format_single_reference(reference, version=DEFAULT_VERSION))
         self.assertTrue(results[0].text)
+
+    def test_resolve_references_reuses_cached_passages(self) -> None:
+        reference = pb.get_references("John 3:16")[0]
+
+        first = resolve_references([reference, reference])
+        second = resolve_references([reference])
+
+        self.assertEqual(len(first), 1)
+        self.assertIs(first[0], second[0])
+
+
+class ExtractTextTests(TestCase):
+    def test_prepare_image_downscales_and_binarizes(self) -> None:
+        image = Image.new("RGB", (4000, 1000), "white")
+        image.paste((40, 40, 40), (0, 0, 2000, 500))
+
+        prepared = utils._prepare_image(image)
+
+        self.assertEqual(prepared.size, (utils.OCR_MAX_DIMENSION, 500))
+        self.assertEqual(set(prepared.getdata()), {0, 255})
+
+    def test_extract_text_reports_missing_tesseract(self) -> None:
+        image_file = BytesIO()
+        Image.new("RGB", (10, 10), "white").save(image_file, format="PNG")
+
+        with (
+            mock.patch.object(utils, "_TESS_API", None),
+            mock.patch.object(utils, "PyTessBaseAPI", side_effect=RuntimeError("no tessdata")),
+        ):
+            with self.assertRaises(SiglaExtractionError):
+                extract_text(image_file)
+
+
+class UploadViewTests(TestCase):
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def _post_image(self):
+        image_file = BytesIO()
+        Image.new("RGB", (10, 10), "white").save(image_file, format="PNG")
+        image_file.name = "sigla.png"
+        image_file.seek(0)
+        return self.client.post(reverse("sigla:upload"), {"image": image_file})
+
+    def _assert_upload_fails(self, error: BaseException, message: str) -> mock.Mock:
+        pool = mock.Mock()
+        pool.submit.return_value.result.side_effect = error
+
+        with mock.patch.object(views, "_OCR_POOL", pool):
+            response = self._post_image()
+            remaining_pool = views._OCR_POOL
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("extracted_text", response.context)
+        self.assertIn(message, [str(item) for item in response.context["messages"]])
+        return remaining_pool
+
+    def test_upload_reports_extraction_error(self) -> None:
+        self._assert_upload_fails(SiglaExtractionError("Brak silnika"), "Brak silnika")
+
+    def test_upload_reports_ocr_timeout(self) -> None:
+        self._assert_upload_fails(
+            views.FutureTimeoutError(),
+            "Odczyt zdjęcia trwał zbyt długo. Spróbuj przesłać mniejszy plik.",
+        )
+
+    def test_upload_discards_broken_ocr_pool(self) -> None:
+        remaining_pool = self._assert_upload_fails(
+            views.BrokenProcessPool(),
+            "Odczyt zdjęcia został przerwany. Spróbuj ponownie lub prześlij mniejszy plik.",
+        )
+
+        self.assertIsNone(remaining_pool)
+
+    def test_repeated_upload_reuses_cached_results(self) -> None:
+        image_file = BytesIO()
+        Image.new("RGB", (10, 10), "white").save(image_file, format="PNG")
+        image_file.name = "sigla.png"
+        pool = mock.Mock()
+        pool.submit.return_value.result.return_value = "Mt 5,1-3"
+
+        with mock.patch.object(views, "_get_ocr_pool", return_value=pool):
+            for _ in range(2):
+                image_file.seek(0)
+                response = self.client.post(reverse("sigla:upload"), {"image": image_file})
+
+        self.assertEqual(pool.submit.call_count, 1)
+        self.assertEqual(response.context["extracted_text"], "Mt 5,1-3")
+        self.assertEqual(len(response.context["results"]), 1)
+
+    def test_cached_results_are_not_reused_across_cache_versions(self) -> None:
+        pool = mock.Mock()
+        pool.submit.return_value.result.return_value = "Mt 5,1-3"
+
+        with mock.patch.object(views, "_get_ocr_pool", return_value=pool):
+            self._post_image()
+            with mock.patch.object(views, "RESULT_CACHE_VERSION", views.RESULT_CACHE_VERSION + 1):
+                self._post_image()
+
+        self.assertEqual(pool.submit.call_count, 2)
+
+
+class OcrPoolTests(TestCase):
+    def _new_pool(self):
+        with mock.patch.object(views, "_OCR_POOL", None):
+            pool = views._get_ocr_pool()
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    @override_settings(SIGLA_OCR_WORKERS=3)
+    def test_pool_uses_configured_workers_and_spawn(self) -> None:
+        with mock.patch.object(views, "ProcessPoolExecutor") as executor:
+            self._new_pool()
+
+        kwargs = executor.call_args.kwargs
+        self.assertEqual(kwargs["max_workers"], 3)
+        self.assertEqual(kwargs["mp_context"].get_start_method(), "spawn")
+
+    @override_settings(SIGLA_OCR_WORKERS=1)
+    def test_extract_text_bytes_runs_in_real_pool(self) -> None:
+        image_file = BytesIO()
+        Image.new("RGB", (10, 10), "white").save(image_file, format="PNG")
+        future = self._new_pool().submit(extract_text_bytes, image_file.getvalue())
+
+        try:
+            text = future.result(timeout=views.OCR_TIMEOUT_SECONDS)
+        except SiglaExtractionError:
+            # Without tessdata the error must still cross the process boundary intact.
+            return
+        self.assertIsInstance(text, str)
@@ -1,21 +1,27 @@
 from __future__ import annotations
 
 import re
+import string
 import unicodedata
 from dataclasses import dataclass
-from typing import Iterable
-
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain
+from operator import attrgetter, itemgetter
+from threading import Lock
+from typing import Iterable, Iterator
+
+import ahocorasick
 import pythonbible as pb
-import pytesseract
 from PIL import Image, ImageOps
-from pytesseract import TesseractNotFoundError
+from tesserocr import PSM, PyTessBaseAPI
 
 
 class SiglaExtractionError(RuntimeError):
     """Raised when the OCR pipeline cannot be executed."""
 
 
-@dataclass(slots=True)
+@dataclass(frozen=True, slots=True)
 class ReferenceResult:
     """A resolved Bible reference with rendered scripture text."""
 
@@ -24,17 +30,23 @@ class ReferenceResult:
 
 
 DEFAULT_VERSION: pb.Version = pb.Version.KING_JAMES
+OCR_LANGUAGES = "pol+eng"
+# Longest image side passed to Tesseract; larger photos are scaled down first.
+OCR_MAX_DIMENSION = 2000
+
+_SCRIPTURE_FORMAT = {
+    "format_type": "plain_text",
+    "include_verse_numbers": True,
+    "version": DEFAULT_VERSION,
+}
 
+_TESS_API: PyTessBaseAPI | None = None
+_TESS_LOCK = Lock()
 
-def _normalize_key(raw: str) -> str:
-    """Return an uppercase key without diacritics, dots or spaces."""
-
-    normalized = unicodedata.normalize("NFKD", raw).replace("Ł", "L").replace("ł", "l")
-    without_marks = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-    cleaned = re.sub(r"[\s\.]", "", without_marks)
-    return cleaned.upper()
-
+_POLISH_LETTERS = "ĄĆĘŁŃÓŚŹŻąćęłńóśźż"
+_POLISH_ASCII = "ACELNOSZZacelnoszz"
 
+# Aliases are written already folded: uppercase ASCII without dots or spaces.
 _RAW_BOOK_ALIASES: dict[pb.Book, tuple[str, ...]] = {
     pb.Book.GENESIS: ("RDZ", "RODZ", "GEN"),
     pb.Book.EXODUS: ("WJ", "WYJ", "EX", "EXODUS"),
@@ -109,113 +121,290 @@ _RAW_BOOK_ALIASES: dict[pb.Book, tuple[str, ...]] = {
     pb.Book.MACCABEES_2: ("2MCH", "2MAC"),
 }
 
-_BOOK_ALIASES: dict[str, pb.Book] = {}
-for book, keys in _RAW_BOOK_ALIASES.items():
-    for key in keys:
-        _BOOK_ALIASES[key] = book
-_REFERENCE_PATTERN = re.compile(
-    r"(?P<book>(?:[1-3]\s*)?[A-Za-zĄĆĘŁŃÓŚŹŻa-ząćęłńóśźż\.]+)\s+" r"(?P<chapter>\d{1,3})(?:[,:](?P<verses>[\d\-–—,.\s]+))?"
+_BOOK_ALIASES: dict[str, pb.Book] = {key: book for book, keys in _RAW_BOOK_ALIASES.items() for key in keys}
+
+_SHORT_TITLES: dict[pb.Book, str] = {
+    book: pb.get_book_titles(book, DEFAULT_VERSION).short_title for book in _RAW_BOOK_ALIASES
+}
+
+# Folds NFC-normalized OCR text to uppercase ASCII letters, ASCII dashes and
+# plain spaces one-for-one, so the folded text keeps its length and
+# find_references_stream can slice pending and resume offsets out of it.
+# Every Unicode whitespace character (all of them lie in the Basic Multilingual
+# Plane), including the narrow no-break space used in "1 Kor".
+_TEXT_WHITESPACE = "".join(char for char in map(chr, range(0x10000)) if char.isspace())
+_TEXT_FOLD = str.maketrans(
+    string.ascii_lowercase + _POLISH_LETTERS + "–—" + _TEXT_WHITESPACE,
+    string.ascii_uppercase + _POLISH_ASCII.upper() + "--" + " " * len(_TEXT_WHITESPACE),
 )
 
 
-def extract_text(image_file) -> str:
-    """Run OCR on the uploaded image and return the raw text."""
+def _alias_variants(key: str) -> set[str]:
+    """Return the spellings of a normalized alias that may appear in folded text."""
 
-    image_file.seek(0)
-    with Image.open(image_file) as image:
-        grayscale = ImageOps.grayscale(image)
-        enhanced = ImageOps.autocontrast(grayscale)
+    variants = {key} | {f"{key[:i]}.{key[i:]}" for i in range(1, len(key))}
+    if key[0].isdigit():
+        variants |= {f"{variant[0]} {variant[1:]}" for variant in variants}
+    return variants
+
+
+def _build_book_automaton() -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    for key, book in _BOOK_ALIASES.items():
+        for variant in _alias_variants(key):
+            automaton.add_word(variant, (len(variant), book))
+    automaton.make_automaton()
+    return automaton
+
+
+_BOOK_AUTOMATON = _build_book_automaton()
+
+# Possessive quantifiers keep noisy OCR runs of digits and punctuation from
+# backtracking. OCR often drops the space between book and chapter ("Łk10,25"),
+# and verses stop before a numbered book such as the "1 Kor" in "Mt 5,1 1 Kor 13".
+_NUMBERED_BOOK_NAMES = sorted({key[1:] for key in _BOOK_ALIASES if key[0].isdigit()}, key=len, reverse=True)
+_CHAPTER_PATTERN = re.compile(
+    r"\.?+\s*+(?P<chapter>\d{1,3}+)"
+    r"(?:[,:](?P<verses>(?:[\d\-,.]|\s(?!\s*+[1-3]\s*+(?:"
+    + "|".join(_NUMBERED_BOOK_NAMES)
+    + r")(?![^\W\d_])))++))?+"
+)
+# Unparsed text kept from earlier lines in find_references_stream; comfortably
+# longer than any single siglum.
+_PENDING_LIMIT = 64
+_VERSE_TRANSLATION = str.maketrans({**dict.fromkeys(_TEXT_WHITESPACE), ".": ","})
+_COMMA_RUN_PATTERN = re.compile(r",{2,}+")
+_VERSE_RANGE_PATTERN = re.compile(r"(?P<start>\d{1,3}+)(?:-(?P<end>\d{1,3}+))?+")
+
+
+def _get_tess_api() -> PyTessBaseAPI:
+    """Return the shared Tesseract handle, loading the language models on first use.
+
+    Callers must hold ``_TESS_LOCK`` because the handle is not thread-safe.
+    """
+
+    global _TESS_API
+    if _TESS_API is None:
         try:
-            text = pytesseract.image_to_string(enhanced, lang="pol+eng")
-        except TesseractNotFoundError as exc:
+            _TESS_API = PyTessBaseAPI(lang=OCR_LANGUAGES, psm=PSM.SINGLE_BLOCK)
+        except RuntimeError as exc:
             raise SiglaExtractionError(
-                "Nie odnaleziono silnika Tesseract. Zainstaluj go lokalnie i ustaw w PATH."
+                "Nie udało się uruchomić silnika Tesseract. Sprawdź, czy zainstalowano pakiety językowe pol i eng."
             ) from exc
+    return _TESS_API
+
+
+def _otsu_threshold(histogram: list[int]) -> int:
+    """Return the grey level that best separates text from background."""
+
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background_weight = 0
+    background_sum = 0
+    best_threshold = 0
+    best_variance = 0.0
+
+    for level, count in enumerate(histogram):
+        background_weight += count
+        foreground_weight = total - background_weight
+        if not background_weight:
+            continue
+        if not foreground_weight:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_weight
+        foreground_mean = (weighted_total - background_sum) / foreground_weight
+        variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = level
+
+    return best_threshold
+
+
+def _prepare_image(image: Image.Image) -> Image.Image:
+    """Downscale the image and binarize it so Tesseract has fewer pixels to process."""
+
+    grayscale = ImageOps.grayscale(image)
+    grayscale.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    enhanced = ImageOps.autocontrast(grayscale)
+    threshold = _otsu_threshold(enhanced.histogram())
+    return enhanced.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+def _recognize(api: PyTessBaseAPI, image_file) -> str:
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        prepared = _prepare_image(image)
     image_file.seek(0)
-    return text
 
+    api.SetImage(prepared)
+    try:
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
 
-def _book_from_match(raw_book: str) -> pb.Book | None:
-    return _BOOK_ALIASES.get(_normalize_key(raw_book))
 
+def extract_text(image_file) -> str:
+    """Run OCR on the uploaded image and return the raw text."""
+
+    return extract_texts([image_file])[0]
+
+
+def extract_text_bytes(data: bytes) -> str:
+    """Run OCR on raw image bytes; usable as a task for a process pool."""
+
+    return extract_text(BytesIO(data))
+
+
+def extract_texts(image_files: Iterable) -> list[str]:
+    """Run OCR on several images, reusing a single Tesseract handle."""
+
+    with _TESS_LOCK:
+        api = _get_tess_api()
+        return [_recognize(api, image_file) for image_file in image_files]
+
+
+def _iter_book_matches(folded_text: str) -> Iterator[tuple[int, pb.Book, re.Match[str]]]:
+    """Yield the start, book and chapter match of each siglum in folded text."""
+
+    candidates: dict[int, list[tuple[int, pb.Book]]] = {}
+    for end, (length, book) in _BOOK_AUTOMATON.iter(folded_text):
+        candidates.setdefault(end, []).append((length, book))
+
+    position = 0
+    for end, aliases in candidates.items():
+        match = _CHAPTER_PATTERN.match(folded_text, end + 1)
+        if not match:
+            continue
+
+        # The longest alias may overlap the previous siglum ("3 J" after a verse
+        # 3), so fall back to shorter aliases ending at the same offset.
+        for length, book in sorted(aliases, key=itemgetter(0), reverse=True):
+            start = end - length + 1
+            if start < position:
+                continue
+            if start and (folded_text[start - 1].isalpha() or folded_text[start - 1] == "."):
+                continue
+
+            position = match.end()
+            yield start, book, match
+            break
 
-def _build_reference(book: pb.Book, chapter: int, verses: str | None) -> Iterable[pb.NormalizedReference]:
-    base_title = pb.get_book_titles(book, DEFAULT_VERSION).short_title
 
+def _build_reference(book: pb.Book, chapter: int, verses: str | None) -> Iterable[pb.NormalizedReference]:
     sanitized_verses = ""
     if verses:
-        primary = verses.split(';', 1)[0]
-        sanitized_verses = (
-            primary.replace(" ", "")
-            .replace("–", "-")
-            .replace("—", "-")
-            .replace("..", ",")
-            .replace(".", ",")
-        )
-        sanitized_verses = sanitized_verses.lstrip(":")
+        # _CHAPTER_PATTERN never lets ";" or ":" into the verses group.
+        sanitized_verses = verses.translate(_VERSE_TRANSLATION)
+        if ",," in sanitized_verses:
+            sanitized_verses = _COMMA_RUN_PATTERN.sub(",", sanitized_verses)
         sanitized_verses = sanitized_verses.strip(',')
 
-    reference_string = f"{base_title} {chapter}"
+    # Verse lists such as "1-3,5" are built directly from their ranges; only text
+    # the range pattern cannot read goes through the pythonbible parser.
+    verse_ranges = [_VERSE_RANGE_PATTERN.fullmatch(item) for item in sanitized_verses.split(",")]
+    if sanitized_verses and all(verse_ranges):
+        references = []
+        for verse_range in verse_ranges:
+            start_verse = int(verse_range.group("start"))
+            end_verse = int(verse_range.group("end") or start_verse)
+            reference = pb.NormalizedReference(book, chapter, start_verse, chapter, end_verse)
+            if pb.is_valid_reference(reference):
+                references.append(reference)
+        return references
+
+    if not sanitized_verses and pb.get_number_of_chapters(book) > 1:
+        if not pb.is_valid_chapter(book, chapter):
+            return []
+        return [pb.NormalizedReference(book, chapter, 1, chapter, pb.get_number_of_verses(book, chapter))]
+
+    reference_string = f"{_SHORT_TITLES[book]} {chapter}"
     if sanitized_verses:
-        if not sanitized_verses.startswith(":") and not sanitized_verses.startswith(","):
-            reference_string += ":"
-        reference_string += sanitized_verses
+        reference_string += f":{sanitized_verses}"
 
     try:
         references = pb.get_references(reference_string)
-    except pb.InvalidBibleParserError:
+    except (pb.InvalidBibleParserError, pb.InvalidChapterError, pb.InvalidVerseError):
         return []
 
     return references
 
 
+_reference_key = attrgetter("book", "start_chapter", "start_verse", "end_chapter", "end_verse")
+
+
 def find_references(text: str) -> list[pb.NormalizedReference]:
     """Parse OCR text and return normalized Bible references."""
 
-    normalized_text = text.replace("\n", " ")
-    references: list[pb.NormalizedReference] = []
-    seen: set[tuple] = set()
+    return find_references_stream((text,))
 
-    for match in _REFERENCE_PATTERN.finditer(normalized_text):
-        book = _book_from_match(match.group("book"))
-        if not book:
-            continue
 
-        chapter = int(match.group("chapter"))
-        verses = match.group("verses")
-
-        for reference in _build_reference(book, chapter, verses):
-            key = (
-                reference.book,
-                reference.start_chapter,
-                reference.start_verse,
-                reference.end_chapter,
-                reference.end_verse,
-            )
-            if key in seen:
-                continue
-            seen.add(key)
-            references.append(reference)
+def find_references_stream(lines: Iterable[str], max_refs: int | None = None) -> list[pb.NormalizedReference]:
+    """Parse OCR text line by line and return normalized Bible references.
 
-    return references
+    A siglum that ends a line is carried over whole, since its verses may continue
+    on the next line; otherwise up to ``_PENDING_LIMIT`` characters of unparsed
+    text are kept. Parsing stops once ``max_refs`` references have been found;
+    a limit below one raises ``ValueError``.
+    """
+
+    if max_refs is not None and max_refs < 1:
+        raise ValueError(f"max_refs must be at least 1, got {max_refs}")
+
+    references: dict[tuple, pb.NormalizedReference] = {}
+    pending = ""
+
+    for line in chain(lines, (None,)):
+        # NFC turns decomposed letters ("s" + U+0301) into the precomposed ones
+        # _TEXT_FOLD maps.
+        folded = pending if line is None else pending + unicodedata.normalize("NFC", line).translate(_TEXT_FOLD)
+        resume = 0
+        held_over = False
+
+        for start, book, match in _iter_book_matches(folded):
+            if line is not None and not folded[match.end():].strip():
+                resume = start
+                held_over = True
+                break
+            resume = match.end()
+
+            chapter = int(match.group("chapter"))
+            verses = match.group("verses")
+
+            for reference in _build_reference(book, chapter, verses):
+                references.setdefault(_reference_key(reference), reference)
+                if max_refs is not None and len(references) >= max_refs:
+                    return list(references.values())
+
+        pending = folded[resume:]
+        # A held-over siglum starts the pending text and is kept whole.
+        if not held_over and len(pending) > _PENDING_LIMIT:
+            cut = pending.find(" ", len(pending) - _PENDING_LIMIT)
+            pending = pending[cut + 1 :] if cut >= 0 else ""
+
+    return list(references.values())
+
+
+@lru_cache(maxsize=4096)
+def _resolve_one(
+    book: pb.Book, start_chapter: int, start_verse: int, end_chapter: int, end_verse: int
+) -> ReferenceResult | None:
+    reference = pb.NormalizedReference(book, start_chapter, start_verse, end_chapter, end_verse)
+    verse_ids = list(pb.convert_reference_to_verse_ids(reference))
+    if not verse_ids:
+        return None
+    passage = pb.format_scripture_text(verse_ids, **_SCRIPTURE_FORMAT).strip()
+    label = pb.format_single_reference(reference, version=DEFAULT_VERSION)
+    return ReferenceResult(label=label, text=passage)
 
 
 def resolve_references(references: Iterable[pb.NormalizedReference]) -> list[ReferenceResult]:
-    """Fetch formatted scripture passages for the provided references."""
+    """Fetch formatted scripture passages for the provided references.
 
-    results: list[ReferenceResult] = []
+    Passages are cached per reference, so recurring ones are formatted only once.
+    """
 
-    for reference in references:
-        verse_ids = pb.convert_references_to_verse_ids([reference])
-        if not verse_ids:
-            continue
-        passage = pb.format_scripture_text(
-            verse_ids,
-            format_type="plain_text",
-            include_verse_numbers=True,
-            version=DEFAULT_VERSION,
-        ).strip()
-        label = pb.format_single_reference(reference, version=DEFAULT_VERSION)
-        results.append(ReferenceResult(label=label, text=passage))
-
-    return results
+    keys = dict.fromkeys(_reference_key(reference) for reference in references)
+    results = [_resolve_one(*key) for key in keys]
+    return [result for result in results if result is not None]
@@ -1,11 +1,53 @@
 from __future__ import annotations
 
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
 from django.urls import reverse_lazy
 from django.views.generic import FormView
 
 from .forms import ImageUploadForm
-from .utils import SiglaExtractionError, extract_text, find_references, resolve_references
+from .utils import SiglaExtractionError, extract_text_bytes, find_references_stream, resolve_references
+
+OCR_TIMEOUT_SECONDS = 60
+MAX_REFERENCES = 200
+RESULT_CACHE_TIMEOUT = 60 * 60 * 24
+# Bump whenever OCR or reference parsing changes, so cached results are not reused.
+RESULT_CACHE_VERSION = 1
+
+_OCR_POOL: ProcessPoolExecutor | None = None
+_OCR_POOL_LOCK = Lock()
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    """Return the worker pool running OCR, one Tesseract handle per process."""
+
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is None:
+            # Spawned workers do not inherit the server's threads and locks.
+            _OCR_POOL = ProcessPoolExecutor(
+                max_workers=settings.SIGLA_OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _OCR_POOL
+
+
+def _discard_ocr_pool(pool: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died, so the next upload starts a fresh one."""
+
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is pool:
+            _OCR_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
 
 class UploadView(FormView):
@@ -16,14 +58,37 @@ class UploadView(FormView):
     def form_valid(self, form: ImageUploadForm):
         image_file = form.cleaned_data["image"]
 
-        try:
-            text = extract_text(image_file)
-        except SiglaExtractionError as error:
-            messages.error(self.request, str(error))
-            return self.form_invalid(form)
+        image_file.seek(0)
+        data = image_file.read()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        cache_key = f"sigla:v{RESULT_CACHE_VERSION}:{digest}"
+
+        cached = cache.get(cache_key)
+        if cached is not None:
+            text, references, results = cached
+        else:
+            pool = _get_ocr_pool()
+
+            try:
+                future = pool.submit(extract_text_bytes, data)
+                text = future.result(timeout=OCR_TIMEOUT_SECONDS)
+            except SiglaExtractionError as error:
+                messages.error(self.request, str(error))
+                return self.form_invalid(form)
+            except FutureTimeoutError:
+                # Only a task still waiting in the queue is dropped; OCR that has
+                # already started keeps running in its worker until it finishes.
+                future.cancel()
+                messages.error(self.request, "Odczyt zdjęcia trwał zbyt długo. Spróbuj przesłać mniejszy plik.")
+                return self.form_invalid(form)
+            except BrokenProcessPool:
+                _discard_ocr_pool(pool)
+                messages.error(self.request, "Odczyt zdjęcia został przerwany. Spróbuj ponownie lub prześlij mniejszy plik.")
+                return self.form_invalid(form)
 
-        references = find_references(text)
-        results = resolve_references(references)
+            references = find_references_stream(text.splitlines(keepends=True), max_refs=MAX_REFERENCES)
+            results = resolve_references(references)
+            cache.set(cache_key, (text, references, results), timeout=RESULT_CACHE_TIMEOUT)
 
         if not results:
             messages.warning(